@@ -1,108 +1,166 @@
 import ROOT
 import os
+import csv
+import re
 import yaml
 import numpy as np
-import pandas as pd
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+WEIGHT_COLUMNS = ['FONLLweight', 'trigger_sf_value', 'trigger_sf_error', 'total_weight']
+# Types of the columns step 1 defines itself (FONLLweight only when the input lacks it)
+DEFINED_TYPES = {'FONLLweight': 'double', 'trigger_sf_value': 'double', 'trigger_sf_error': 'double', 'path_idx': 'int'}
+# Per-file/per-candidate bookkeeping, never written to the outputs
+INTERNAL_COLUMNS = {'file_idx', 'region_mask'}
+IDENTIFIER = re.compile(r'\b[A-Za-z_]\w*\b')
 
 # --------------------------------------------------------------------------------
-# C++ HELPER (Unchanged)
+# C++ HELPERS
+# C++ helpers are queued and handed to Cling in a single Declare by _flush_decl();
+# the SF and path-assignment helpers are compiled by Numba instead
 # --------------------------------------------------------------------------------
+_PENDING_DECL = {}
+_DECLARED = set()
+
+def _queue_decl(name, cpp_code):
+    if name in _DECLARED or hasattr(ROOT, name): return
+    _PENDING_DECL[name] = cpp_code
+    _DECLARED.add(name)
+
+def _flush_decl():
+    if not _PENDING_DECL: return
+    if not ROOT.gInterpreter.Declare('\n'.join(_PENDING_DECL.values())):
+        raise RuntimeError(f"Failed to declare C++ helpers: {', '.join(_PENDING_DECL)}")
+    _PENDING_DECL.clear()
+
 def declare_cpp_helper(trigger_data):
-    if hasattr(ROOT, 'assign_path'): return
+    if 'assign_path_idx' in _DECLARED: return
     paths = list(trigger_data.keys())
     fractions = [trigger_data[k][0] for k in paths]
     norm_fracs = np.array(fractions) / sum(fractions)
     cdf = np.cumsum(norm_fracs)
 
+    # Path index = number of CDF edges below rand; the last edge is skipped
+    # so rand beyond it still maps to the last path.
+    # Numba compiles this to native code, exposed to RDF as Numba::assign_path_idx
+    @ROOT.Numba.Declare(['double'], 'int')
+    def assign_path_idx(rand):
+        i = 0
+        for k in range(cdf.shape[0] - 1):
+            if rand >= cdf[k]: i += 1
+        return i
+    _DECLARED.add('assign_path_idx')
+
+def declare_rng_helper(seed):
+    # Counter-based uniform draw (splitmix64 hash of the seed and the event's
+    # run/luminosityBlock/event): no shared generator state between threads, and
+    # the number depends only on the event itself, not on rdfentry_ (which is
+    # not a stable entry number under implicit MT), so the mixture is reproducible.
+    # Every candidate of an event gets the same draw, i.e. the same trigger path.
     cpp_code = f'''
-    #include <vector>
-    #include <string>
-    std::string assign_path(double rand) {{
-        const std::vector<std::string> paths = {{ {", ".join(f'"{p}"' for p in paths)} }};
-        const std::vector<double> cdf = {{ {", ".join(str(x) for x in cdf)} }};
-        for (size_t i = 0; i < cdf.size(); ++i) {{
-            if (rand < cdf[i]) return paths[i];
-        }}
-        return paths.back();
+    #include <cstdint>
+    inline uint64_t path_rand_mix(uint64_t z) {{
+        z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+        z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+        z ^= z >> 31;
+        return z;
+    }}
+    inline double path_rand(ULong64_t run, ULong64_t lumi, ULong64_t event) {{
+        uint64_t z = path_rand_mix({int(seed)}ULL + (run + 1) * 0x9E3779B97F4A7C15ULL);
+        z = path_rand_mix(z + (lumi + 1) * 0x9E3779B97F4A7C15ULL);
+        z = path_rand_mix(z + (event + 1) * 0x9E3779B97F4A7C15ULL);
+        return (z >> 11) * 0x1.0p-53;
     }}
     '''
-    ROOT.gInterpreter.Declare(cpp_code)
-
-def build_sf_expression(sf_bins):
-    val_parts, unc_parts = [], []
-    for ptmin, ptmax, val, unc in sf_bins:
-        ptmax = float(ptmax)
-        if ptmax == float('inf'): cond = f'(BToKEE_fit_l2_pt >= {ptmin})'
-        else: cond = f'(BToKEE_fit_l2_pt >= {ptmin} && BToKEE_fit_l2_pt < {ptmax})'
-        val_parts.append(f'{cond} ? {val}')
-        unc_parts.append(f'{cond} ? {unc}')
-    return ' : '.join(val_parts) + ' : 1.0', ' : '.join(unc_parts) + ' : 0.0'
+    _queue_decl('path_rand', cpp_code)
 
-# --------------------------------------------------------------------------------
-# MAIN PROCESSING LOGIC
-# --------------------------------------------------------------------------------
-def process_file(file_info, config, base_output_dir, args):
-    input_path = file_info['path']
-    sample_name = file_info['name']
-    is_data = file_info.get('is_data', False)
-    target_regions = file_info.get('regions', ['none']) # Default to list
+def declare_sf_helper(sf_bins):
+    if 'trigger_sf_val' in _DECLARED: return
+    # [pt_min, pt_max, value, uncertainty] rows, scanned in ascending pt order
+    # Exposed to RDF as Numba::trigger_sf_val / Numba::trigger_sf_unc
+    bins = np.array([[float(x) for x in b] for b in sf_bins], dtype=np.float64)
 
-    if not os.path.exists(input_path):
-        print(f"Skipping missing: {input_path}")
-        return []
+    @ROOT.Numba.Declare(['double'], 'double')
+    def trigger_sf_val(pt):
+        for i in range(bins.shape[0]):
+            if pt >= bins[i, 0] and pt < bins[i, 1]: return bins[i, 2]
+        return 1.0
 
-    print(f"\nProcessing {sample_name}...")
-    
-    # 0. Load Dataframe
-    df = ROOT.RDataFrame("Events", input_path)
+    @ROOT.Numba.Declare(['double'], 'double')
+    def trigger_sf_unc(pt):
+        for i in range(bins.shape[0]):
+            if pt >= bins[i, 0] and pt < bins[i, 1]: return bins[i, 3]
+        return 0.0
+    _DECLARED.add('trigger_sf_val')
 
-    # -----------------------------------------------------------------------
-    # CRITICAL STEP 1: GLOBAL DEFINITIONS (Must happen BEFORE filtering)
-    # This ensures random numbers are assigned to the same Event IDs regardless of cuts
-    # -----------------------------------------------------------------------
-    
-    # Define Weights
-    if is_data:
-        df = df.Define('FONLLweight', '1.0') \
-               .Define('trigger_sf_value', '1.0') \
-               .Define('trigger_sf_error', '0.0') \
-               .Define('total_weight', '1.0')
-    else:
-        trig_sf_val, trig_sf_unc = build_sf_expression(config['trigger_sf_params']['bins'])
-        
-        if 'FONLLweight' not in [str(c) for c in df.GetColumnNames()]:
-             df = df.Define('FONLLweight', '1.0')
+def resolve_snapshot_columns(df, patterns):
+    """
+    Expands the configured output column patterns against the dataframe.
+    An empty list keeps every column except the bookkeeping ones step 1 adds.
+    """
+    available = [str(c) for c in df.GetColumnNames() if str(c) not in INTERNAL_COLUMNS]
+    cols = [c for c in available if not patterns or any(re.fullmatch(p, c) for p in patterns)]
+    # Weights defined in step 1 are always needed downstream
+    for c in WEIGHT_COLUMNS:
+        if c not in cols: cols.append(c)
+    return cols
 
-        df = df.Define('trigger_sf_value', trig_sf_val) \
-               .Define('trigger_sf_error', trig_sf_unc) \
-               .Define('total_weight', 'FONLLweight * trigger_sf_value')
+def declare_cut_helpers(df, helpers, suffix):
+    """
+    Queues cut/weight expressions as typed C++ functions, so RDF binds directly
+    to compiled symbols instead of jitting each string. Argument types come from
+    the input schema in `df`, or DEFINED_TYPES for columns step 1 defines.
+    `helpers` maps helper name -> (return type, expression); each is declared as
+    `<name>_<suffix>`, so inputs with different schemas get their own overloads.
+    Returns helper name -> (declared name, column arguments in call order).
+    """
+    file_cols = set(str(c) for c in df.GetColumnNames())
+    available = file_cols | set(DEFINED_TYPES)
+    helper_cols = {}
+    for name, (ret_type, expr) in helpers.items():
+        tokens = IDENTIFIER.findall(expr)
+        cols = list(dict.fromkeys(t for t in tokens if t in available))
+        helper_cols[name] = (f'{name}_{suffix}', cols)
+        col_types = [df.GetColumnType(c) if c in file_cols else DEFINED_TYPES[c] for c in cols]
+        cpp_args = ', '.join(f'const {t}& {c}' for t, c in zip(col_types, cols))
+        _queue_decl(f'{name}_{suffix}', f'{ret_type} {name}_{suffix}({cpp_args}) {{ return {expr}; }}')
+    return helper_cols
 
-    # Define Trigger Columns (The "Fragile" Part)
+def build_selection(config, args, regions):
+    """
+    Builds every cut/trigger expression once, so all samples share identical
+    strings (and hence the same jitted code) instead of rebuilding them per file.
+    """
     trigger_data = config['trigger']['fractions']
-    
-    # Case A: MC Mixture (Requires Random Generation on raw DF)
-    if not is_data and args.mode == 'mix':
-        ROOT.gRandom.SetSeed(config['random_seed'])
-        declare_cpp_helper(trigger_data)
-        
-        # Define random assignment on the FULL dataset
-        df = df.Define('rand', 'gRandom->Rndm()') \
-               .Define('assigned_path', 'assign_path(rand)')
+    # All q2 cuts are evaluated together into one bitmask (bit k <-> regions[k]),
+    # so each region only tests its bit instead of re-running its own cut
+    region_bits = {region: 1 << k for k, region in enumerate(regions)}
+    region_mask = ' | '.join(f'(({config["q2_cuts"].get(r, "1")}) ? {b}u : 0u)' for r, b in region_bits.items())
+    selection = {
+        'region_bits': region_bits,
+        'cut_helpers': {
+            'pass_triplet': ('bool', config['preselection']['triplet']),
+            'pass_presel_bdt': ('bool', config['preselection']['bdt_score']),
+            'pass_antid0': ('bool', config['preselection']['anti_d0']),
+            'calc_region_mask': ('unsigned int', region_mask),
+        },
+        'weight_helper': {'calc_total_weight': ('double', 'FONLLweight * trigger_sf_value')},
+        'mix_pass_cols': [],
+    }
 
-        # Define individual pass columns
-        pass_cols = []
-        for key, val in trigger_data.items():
+    # Case A: MC Mixture (one pass column per path, indexed like trigger.fractions)
+    if args.mode == 'mix':
+        for i, (key, val) in enumerate(trigger_data.items()):
             l1, hlt = val[1], val[2]
-            col_name = f'{key}_pass'
-            df = df.Define(col_name, f'(assigned_path == "{key}") && ({l1} && {hlt})')
-            pass_cols.append(col_name)
+            selection['mix_pass_cols'].append((f'{key}_pass', f'(path_idx == {i}) && ({l1} && {hlt})'))
         
-        # The filter string is just OR of these columns
-        trig_filter_string = ' || '.join(pass_cols)
+        # The filter is just the OR of these conditions (spelled out rather than
+        # via the pass columns, so it can be compiled against the input types)
+        selection['mc_trig_filter'] = ' || '.join(f'({e})' for _, e in selection['mix_pass_cols'])
 
-    # Case B: MC Single / Data (Logic-based, no new columns needed immediately)
-    elif not is_data and args.mode == 'single':
+    # Case B: MC Single (Logic-based, no new columns needed immediately)
+    else:
         target = args.target_trigger
         l1_t, hlt_t = trigger_data[target][1], trigger_data[target][2]
         
@@ -115,79 +173,251 @@ def process_file(file_info, config, base_output_dir, args):
         # NEW LOGIC (Pure Selection):
         # "Keep events where THIS trigger fired."
         # (We do not care if other triggers also fired)
-        trig_filter_string = f'({l1_t} && {hlt_t})'
+        selection['mc_trig_filter'] = f'({l1_t} && {hlt_t})'
+
+    # Data
+    if args.mode == 'single':
+        target = args.target_trigger
+        selection['data_trig_filter'] = f'{trigger_data[target][1]} && {trigger_data[target][2]}'
+    else:
+        others = [f'({v[1]} && {v[2]})' for k,v in trigger_data.items()]
+        selection['data_trig_filter'] = ' || '.join(others)
+
+    return selection
+
+def build_snapshot_options(snapshot_cfg):
+    """Lazy RSnapshotOptions shared by every output file, with configurable compression."""
+    opts = ROOT.RDF.RSnapshotOptions()
+    opts.fMode = "RECREATE"
+    opts.fLazy = True
+    algo = snapshot_cfg.get('compression_algorithm', 'zstd').upper()
+    opts.fCompressionAlgorithm = getattr(ROOT.ROOT.RCompressionSetting.EAlgorithm, f'k{algo}')
+    opts.fCompressionLevel = snapshot_cfg.get('compression_level', 5)
+    opts.fAutoFlush = snapshot_cfg.get('auto_flush', -30 * 1024 * 1024)
+    return opts
+
+# --------------------------------------------------------------------------------
+# MAIN PROCESSING LOGIC
+# --------------------------------------------------------------------------------
+def per_file_expr(paths, values):
+    """
+    DefinePerSample expression mapping each input file to its value. The sample
+    ID is compared exactly ("<file>/<tree>"), so no path can match another one
+    that merely contains it. A file matching none of them (e.g. a URL that ROOT
+    reports differently) throws instead of silently selecting nothing.
+    """
+    cases = ' : '.join(f'rdfsampleinfo_.AsString() == "{p}/Events" ? {v}' for p, v in zip(paths, values))
+    return f'{cases} : throw std::runtime_error("unmatched input file: " + rdfsampleinfo_.AsString())'
+
+def output_path(base_output_dir, region, input_path, args):
+    mode_suffix = f"_{args.target_trigger}" if args.mode == 'single' else "_mix"
+    out_name = os.path.basename(input_path).replace('.root', f'_skimmed{mode_suffix}.root')
+    return os.path.join(base_output_dir, region, out_name)
+
+def process_group(entries, is_data, config, selection, typed, snapshot_opts, base_output_dir, args):
+    """
+    Books one RDF graph over every existing sample of the same type (MC or data)
+    and input schema: the inputs are chained, the shared definitions are jitted
+    once, and each sample branches off by its per-file index before the selection.
+    `typed` holds the helpers and Sum types declared for this group's schema.
+    """
+    # 0. Load Dataframe (one chain for the whole group, each input file once)
+    paths = list(dict.fromkeys(e['path'] for e in entries))
+    df = ROOT.RDataFrame("Events", paths)
 
-    else: # Data
-        if args.mode == 'single':
-            target = args.target_trigger
-            trig_filter_string = f'{trigger_data[target][1]} && {trigger_data[target][2]}'
-        else:
-            others = [f'({v[1]} && {v[2]})' for k,v in trigger_data.items()]
-            trig_filter_string = ' || '.join(others)
+    # Per-file index, evaluated once per input file rather than per event;
+    # samples sharing an input file branch off the same index
+    df = df.DefinePerSample('file_idx', per_file_expr(paths, range(len(paths))))
+
+    # -----------------------------------------------------------------------
+    # CRITICAL STEP 1: GLOBAL DEFINITIONS (Must happen BEFORE filtering)
+    # This ensures random numbers are assigned to the same Event IDs regardless of cuts
+    # -----------------------------------------------------------------------
+    
+    # Define Weights
+    # (data is unweighted: its cutflow uses Counts, and the constant weight
+    # columns are only added to the outputs right before the snapshot)
+    helpers = {k: (getattr(ROOT, name), cols) for k, (name, cols) in typed['helpers'].items()}
+    if not is_data:
+        if 'FONLLweight' not in [str(c) for c in df.GetColumnNames()]:
+             df = df.Define('FONLLweight', '1.0')
+
+        df = df.Define('trigger_sf_value', 'Numba::trigger_sf_val(BToKEE_fit_l2_pt)') \
+               .Define('trigger_sf_error', 'Numba::trigger_sf_unc(BToKEE_fit_l2_pt)') \
+               .Define('total_weight', *helpers['calc_total_weight'])
+
+    # Case A: MC Mixture (Requires Random Generation on raw DF)
+    if not is_data and args.mode == 'mix':
+        # Define random assignment on the FULL dataset
+        # (path index follows the order of trigger.fractions in the config).
+        # The draw is keyed on the event ID, so it does not depend on the file,
+        # the chain or the processing order
+        df = df.Define('path_idx', 'Numba::assign_path_idx(path_rand(run, luminosityBlock, event))')
+
+        # Define individual pass columns
+        for col_name, expr in selection['mix_pass_cols']:
+            df = df.Define(col_name, expr)
+
+    snapshot_cols = resolve_snapshot_columns(df, config.get('snapshot', {}).get('columns', []))
+
+    pending_actions, pending_snapshots, log_row_builders = [], [], []
+    for file_info in entries:
+        actions, snapshots, row_builders = process_file(
+            file_info, df.Filter(f"file_idx == {paths.index(file_info['path'])}"), is_data, selection,
+            helpers, typed['sum_types'], snapshot_cols, snapshot_opts, base_output_dir, args
+        )
+        pending_actions.extend(actions)
+        pending_snapshots.extend(snapshots)
+        log_row_builders.extend(row_builders)
+
+    return pending_actions, pending_snapshots, log_row_builders
+
+def process_file(file_info, df, is_data, selection, helpers, sum_types, snapshot_cols, snapshot_opts, base_output_dir, args):
+    input_path = file_info['path']
+    sample_name = file_info['name']
+    target_regions = file_info.get('regions', ['none']) # Default to list
+
+    print(f"\nProcessing {sample_name}...")
 
     # -----------------------------------------------------------------------
     # STEP 2: SEQUENTIAL FILTERING
     # -----------------------------------------------------------------------
     
     # A. Triplet Cuts
-    df_triplet = df.Filter(config['preselection']['triplet'])
+    df_triplet = df.Filter(*helpers['pass_triplet'])
     
-    # B. Trigger Filter (Using the string prepared above)
-    df_trig = df_triplet.Filter(trig_filter_string)
+    # B. Trigger Filter (compiled from the string prepared in build_selection)
+    df_trig = df_triplet.Filter(*helpers['pass_trigger'])
 
     # C. Preselection & Anti-D0
-    df_presel = df_trig.Filter(config['preselection']['bdt_score'])
-    df_antid0 = df_presel.Filter(config['preselection']['anti_d0'])
+    df_presel = df_trig.Filter(*helpers['pass_presel_bdt'])
+    df_antid0 = df_presel.Filter(*helpers['pass_antid0'])
+
+    # D. Q2 regions, computed once per surviving candidate
+    df_regions = df_antid0.Define('region_mask', *helpers['calc_region_mask'])
 
     # -----------------------------------------------------------------------
     # STEP 3: REGION LOOP (Branching Paths)
+    # Nothing below triggers an event loop: all sums and snapshots are booked
+    # lazily and handed back to the driver, which runs every sample at once.
     # -----------------------------------------------------------------------
-    file_results = []
 
-    # Calculate common counts once
-    count_before = df.Sum('FONLLweight').GetValue()
-    count_triplet = df_triplet.Sum('FONLLweight').GetValue()
-    count_trig = df_trig.Sum('FONLLweight').GetValue()
-    sow_trig = df_trig.Sum('total_weight').GetValue()
-    sow_presel = df_presel.Sum('total_weight').GetValue()
-    sow_antid0 = df_antid0.Sum('total_weight').GetValue()
+    # Book common counts once
+    # (Sums are instantiated with their known column type, skipping type inference)
+    def book_sum(node, col):
+        return node.Count() if is_data else node.Sum[sum_types[col]](col)
+
+    count_before = book_sum(df, 'FONLLweight')
+    count_triplet = book_sum(df_triplet, 'FONLLweight')
+    count_trig = book_sum(df_trig, 'FONLLweight')
+    sow_trig = count_trig if is_data else book_sum(df_trig, 'total_weight')
+    sow_presel = book_sum(df_presel, 'total_weight')
+    sow_antid0 = book_sum(df_antid0, 'total_weight')
+    pending_actions = [count_before, count_triplet, count_trig, sow_presel, sow_antid0]
+    if not is_data: pending_actions.append(sow_trig)
 
+    pending_snapshots, log_row_builders = [], []
     for region in target_regions:
         # Determine output path
-        region_dir = os.path.join(base_output_dir, region)
-        os.makedirs(region_dir, exist_ok=True)
-        
-        mode_suffix = f"_{args.target_trigger}" if args.mode == 'single' else "_mix"
-        out_name = os.path.basename(input_path).replace('.root', f'_skimmed{mode_suffix}.root')
-        out_path = os.path.join(region_dir, out_name)
+        out_path = output_path(base_output_dir, region, input_path, args)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
         # Apply Region-Specific Q2 Cut
-        q2_cut_str = config['q2_cuts'].get(region, "1")
-        df_final = df_antid0.Filter(q2_cut_str)
+        df_final = df_regions.Filter(f"(region_mask & {selection['region_bits'][region]}u) != 0")
         
-        # Count Final
-        sow_final = df_final.Sum('total_weight').GetValue()
-
-        # Log
-        file_results.append({
-            'Sample Name': sample_name,
-            'Region': region,
-            'Trigger_Mode': args.target_trigger if args.mode == 'single' else 'Mixture',
-            'Before': count_before,
-            'After_Triplet': count_triplet,
-            'After_Trigger': count_trig,
-            'SumWeights_Trigger': sow_trig,
-            'After_PreselBDT': sow_presel,
-            'After_AntiD0': sow_antid0,
-            'After_Q2': sow_final
-        })
+        # Book Final Count + Snapshot
+        sow_final = book_sum(df_final, 'total_weight')
+        pending_actions.append(sow_final)
+
+        if is_data:
+            df_final = df_final.Define('FONLLweight', '1.0') \
+                               .Define('trigger_sf_value', '1.0') \
+                               .Define('trigger_sf_error', '0.0') \
+                               .Define('total_weight', '1.0')
 
         print(f"  -> Saving {region} region to {out_path}")
-        opts = ROOT.RDF.RSnapshotOptions()
-        opts.fMode = "RECREATE"
-        df_final.Snapshot("Events", out_path, "", opts)
+        pending_snapshots.append(df_final.Snapshot("Events", out_path, snapshot_cols, snapshot_opts))
+
+        # Log (only resolved once the driver has run the event loop)
+        def build_row(region=region, sow_final=sow_final):
+            return {
+                'Sample Name': sample_name,
+                'Region': region,
+                'Trigger_Mode': args.target_trigger if args.mode == 'single' else 'Mixture',
+                'Before': count_before.GetValue(),
+                'After_Triplet': count_triplet.GetValue(),
+                'After_Trigger': count_trig.GetValue(),
+                'SumWeights_Trigger': sow_trig.GetValue(),
+                'After_PreselBDT': sow_presel.GetValue(),
+                'After_AntiD0': sow_antid0.GetValue(),
+                'After_Q2': sow_final.GetValue()
+            }
+        log_row_builders.append(build_row)
+
+    return pending_actions, pending_snapshots, log_row_builders
+
+def run_samples(samples, config, args, nthreads):
+    """
+    Declares the helpers, books every sample and runs them in one RunGraphs call.
+    Self-contained so it can also run inside a worker process; returns the log rows.
+    """
+    ROOT.ROOT.EnableImplicitMT(nthreads)
 
-    return file_results
+    # Helpers and expression strings are prepared once for all samples
+    declare_sf_helper(config['trigger_sf_params']['bins'])
+    if args.mode == 'mix':
+        declare_cpp_helper(config['trigger']['fractions'])
+        declare_rng_helper(config['random_seed'])
+    regions = list(config['q2_cuts'])
+    for entry in samples:
+        regions += [r for r in entry.get('regions', ['none']) if r not in regions]
+    selection = build_selection(config, args, regions)
+
+    # Inputs are grouped by sample type and by the types of every column the
+    # helpers read (FONLLweight included, present or not); each group gets its
+    # own chain and its own compiled predicates, typed against its first input
+    exprs = [expr for _, expr in selection['cut_helpers'].values()]
+    exprs += [selection['mc_trig_filter'], selection['data_trig_filter'], 'FONLLweight']
+    referenced = set(IDENTIFIER.findall(' '.join(exprs)))
+    groups, schema_dfs = {}, {}
+    for e in samples:
+        if not os.path.exists(e['path']):
+            print(f"Skipping missing: {e['path']}")
+            continue
+        if e['path'] not in schema_dfs: schema_dfs[e['path']] = ROOT.RDataFrame("Events", e['path'])
+        schema_df = schema_dfs[e['path']]
+        file_cols = set(str(c) for c in schema_df.GetColumnNames())
+        schema = tuple((c, str(schema_df.GetColumnType(c))) for c in sorted(referenced & file_cols))
+        groups.setdefault((e.get('is_data', False), schema), []).append(e)
+
+    typed = {}
+    for k, ((is_data, schema), group) in enumerate(groups.items()):
+        schema_df = schema_dfs[group[0]['path']]
+        helpers = dict(selection['cut_helpers'])
+        helpers['pass_trigger'] = ('bool', selection['data_trig_filter' if is_data else 'mc_trig_filter'])
+        if not is_data: helpers.update(selection['weight_helper'])
+        typed[k] = {
+            'helpers': declare_cut_helpers(schema_df, helpers, f'g{k}'),
+            'sum_types': {
+                'FONLLweight': dict(schema).get('FONLLweight', DEFINED_TYPES['FONLLweight']),
+                'total_weight': 'double',
+            },
+        }
+    _flush_decl()
+
+    snapshot_opts = build_snapshot_options(config.get('snapshot', {}))
+
+    # Book every sample first (one graph per schema group), then run all graphs concurrently in one go
+    all_pending, all_row_builders = [], []
+    for k, ((is_data, _), group) in enumerate(groups.items()):
+        actions, snapshots, row_builders = process_group(group, is_data, config, selection, typed[k], snapshot_opts, args.output, args)
+        all_pending.extend(actions + snapshots)
+        all_row_builders.extend(row_builders)
+
+    if all_pending:
+        ROOT.RDF.RunGraphs(all_pending)
+
+    return [build_row() for build_row in all_row_builders]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -196,20 +426,47 @@ if __name__ == "__main__":
     parser.add_argument('--mode', choices=['mix', 'single'], default='mix')
     parser.add_argument('--target_trigger', default=None)
     parser.add_argument('--output', default='../data/pre_bdt_ntuples')
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Split the samples over N processes (os.cpu_count()//N threads each)")
     args = parser.parse_args()
 
-    ROOT.ROOT.EnableImplicitMT()
-
     with open(args.config) as f: config = yaml.safe_load(f)
     with open(args.samples) as f: sample_list = yaml.safe_load(f)
 
     if args.mode == 'single' and not args.target_trigger:
         raise ValueError("Single mode requires --target_trigger")
 
-    all_results = []
-    for entry in sample_list['samples']:
-        res_list = process_file(entry, config, args.output, args)
-        all_results.extend(res_list)
+    samples = sample_list['samples']
+    # Every (input, region) pair needs its own output file: the snapshots run
+    # concurrently, so two samples writing the same file would corrupt it
+    outputs = {}
+    for e in samples:
+        for region in e.get('regions', ['none']):
+            out = output_path(args.output, region, e['path'], args)
+            if out in outputs:
+                raise ValueError(f"Samples '{outputs[out]}' and '{e['name']}' would both write {out}")
+            outputs[out] = e['name']
+
+    # Samples reading the same input stay in one worker, so they share its chain.
+    # The path draw only depends on the seed and the event ID (see
+    # declare_rng_helper), not on which worker or chain an event is read in
+    by_path = {}
+    for e in samples: by_path.setdefault(e['path'], []).append(e)
+    units = list(by_path.values())
+    workers = max(1, min(args.workers, len(units)))
+    if workers == 1:
+        all_results = run_samples(samples, config, args, os.cpu_count())
+    else:
+        # Independent samples in separate processes (spawned: ROOT is not fork-safe)
+        nthreads = max(1, os.cpu_count() // workers)
+        chunks = [[e for unit in units[i::workers] for e in unit] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as ex:
+            futures = [ex.submit(run_samples, chunk, config, args, nthreads) for chunk in chunks]
+            all_results = [row for f in futures for row in f.result()]
+
+    # Log rows follow the order of the sample list
+    sample_order = {e['name']: i for i, e in enumerate(samples)}
+    all_results.sort(key=lambda r: sample_order[r['Sample Name']])
 
     # Log Saving
     os.makedirs('../data/logs', exist_ok=True)
@@ -219,4 +476,7 @@ if __name__ == "__main__":
     else:
         log_name = f'cutflow_step1_mix.csv'
     
-    pd.DataFrame(all_results).to_csv(os.path.join('../data/logs', log_name), index=False)
+    with open(os.path.join('../data/logs', log_name), 'w', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=list(all_results[0]) if all_results else [], lineterminator='\n')
+        w.writeheader()
+        w.writerows(all_results)
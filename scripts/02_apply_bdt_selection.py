@@ -1,31 +1,50 @@
 import ROOT
 import os
+import csv
+import re
 import yaml
-import pandas as pd
 import argparse
 
-def find_scored_file(input_base_dir, region, sample_name, core_filename, suffix, trig_tag):
-    """
-    Intelligently hunts for the scored file in various subdirectory structures
-    and matching variable intermediate suffixes.
-    """
-    # 1. Define Candidate Directories
+def candidate_dirs(input_base_dir, region, sample_name):
     # We check these locations in order of likelihood
-    candidate_dirs = [
+    return [
         os.path.join(input_base_dir, region),                     # Standard: /jpsi/
         os.path.join(input_base_dir, f"{region}_wScores"),        # Dir Suffix: /jpsi_wScores/
         os.path.join(input_base_dir, sample_name, region),        # Sample folder: /Bd_JpsiK/jpsi/
         os.path.join(input_base_dir, sample_name, f"{region}_wScores") # Combo: /Bd_JpsiK/jpsi_wScores/
     ]
 
+def build_file_index(input_base_dir, samples, suffix):
+    """
+    Lists each directory that find_scored_file may search for the configured
+    samples and regions once, keeping only scored ROOT files. Directories that
+    are missing or unreadable are left out, like a failed lookup.
+    """
+    index = {}
+    for entry in samples:
+        for region in entry.get('regions', ['none']):
+            for d in candidate_dirs(input_base_dir, region, entry['name']):
+                if d in index: continue
+                try:
+                    with os.scandir(d) as it:
+                        index[d] = sorted(e.name for e in it if e.name.endswith(suffix + '.root') and e.is_file())
+                except OSError:
+                    index[d] = None
+    return index
+
+def find_scored_file(file_index, input_base_dir, region, sample_name, core_filename, suffix, trig_tag):
+    """
+    Intelligently hunts for the scored file in various subdirectory structures
+    and matching variable intermediate suffixes.
+    """
     found_file = None
     
-    for d in candidate_dirs:
-        if not os.path.exists(d):
+    # 1. Candidate Directories
+    for d in candidate_dirs(input_base_dir, region, sample_name):
+        # Pre-scanned listing of this candidate directory
+        files = file_index.get(d)
+        if files is None:
             continue
-            
-        # List all files in this candidate directory
-        files = os.listdir(d)
         
         # 2. Filter files
         # Criteria:
@@ -50,7 +69,7 @@ def find_scored_file(input_base_dir, region, sample_name, core_filename, suffix,
 
     return found_file
 
-def process_step2(file_info, config, input_base_dir, args):
+def process_step2(file_info, config, input_base_dir, file_index, args):
     sample_name = file_info['name']
     target_regions = file_info.get('regions', ['none'])
     
@@ -71,6 +90,7 @@ def process_step2(file_info, config, input_base_dir, args):
         
         # USE SMART FINDER
         input_path = find_scored_file(
+            file_index,
             input_base_dir, 
             region, 
             sample_name, 
@@ -86,14 +106,21 @@ def process_step2(file_info, config, input_base_dir, args):
         # 2. Apply Selection
         df = ROOT.RDataFrame("mytree", input_path)
         
-        cols = [str(c) for c in df.GetColumnNames()]
+        # Column names of this file, read once for all the checks below
+        cols = set(str(c) for c in df.GetColumnNames())
         if bdt_branch not in cols:
             print(f"  [Error] Branch '{bdt_branch}' not found in {input_path}!")
             continue
 
-        # Apply Global Cut
-        cut_expression = f"{bdt_branch} > {global_cut}"
-        df_final = df.Filter(cut_expression)
+        # Apply Global Cut (compiled once per score column type, e.g. pass_bdt_float)
+        score_type = str(df.GetColumnType(bdt_branch))
+        helper = 'pass_bdt_' + re.sub(r'\W', '_', score_type)
+        if not hasattr(ROOT, helper):
+            if not ROOT.gInterpreter.Declare(
+                f'bool {helper}(const {score_type}& score) {{ return score > {global_cut}; }}'
+            ):
+                raise RuntimeError(f"Failed to declare C++ helper: {helper}")
+        df_final = df.Filter(getattr(ROOT, helper), [bdt_branch])
         
         # 3. Count
         if 'total_weight' not in cols:
@@ -104,8 +131,9 @@ def process_step2(file_info, config, input_base_dir, args):
              sow_before = df.Count().GetValue()
              sow_final = df_final.Count().GetValue()
         else:
-             sow_before = df.Sum('total_weight').GetValue()
-             sow_final = df_final.Sum('total_weight').GetValue()
+             weight_type = df.GetColumnType('total_weight')
+             sow_before = df.Sum[weight_type]('total_weight').GetValue()
+             sow_final = df_final.Sum[weight_type]('total_weight').GetValue()
         
         # Efficiency Check
         eff = 0.0
@@ -152,12 +180,18 @@ if __name__ == "__main__":
     with open(args.config) as f: config = yaml.safe_load(f)
     with open(args.samples) as f: sample_list = yaml.safe_load(f)
 
+    # List the candidate directories once instead of per sample/region
+    file_index = build_file_index(args.input_dir, sample_list['samples'], args.bdt_suffix)
+
     all_results = []
     for entry in sample_list['samples']:
-        res = process_step2(entry, config, args.input_dir, args)
+        res = process_step2(entry, config, args.input_dir, file_index, args)
         all_results.extend(res)
 
     os.makedirs('../data/logs', exist_ok=True)
     log_name = f'cutflow_step2_{args.trigger_tag}.csv'
-    pd.DataFrame(all_results).to_csv(os.path.join('../data/logs', log_name), index=False)
+    with open(os.path.join('../data/logs', log_name), 'w', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=list(all_results[0]) if all_results else [], lineterminator='\n')
+        w.writeheader()
+        w.writerows(all_results)
     print(f"\nStep 2 Log saved to ../data/logs/{log_name}")
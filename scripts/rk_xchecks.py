@@ -1,5 +1,5 @@
 import numpy as np
-from uncertainties import ufloat
+from functools import reduce
 import yaml
 import argparse
 import sys
@@ -10,14 +10,37 @@ class dotdict(dict):
     __setattr__ = dict.__setitem__
     __delattr__ = dict.__delitem__
 
-def get_ufloat(d):
-    """Parses a dict with 'value' and 'error' keys into a ufloat."""
-    return ufloat(float(d['value']), float(d['error']))
+def U(v, e):
+    """A measurement as [value, variance], propagated at first order."""
+    return np.array([v, e*e], dtype=np.float64)
+
+def mul(a, b):
+    """Product of two independent measurements."""
+    return np.array([a[0]*b[0], a[0]**2*b[1] + b[0]**2*a[1]])
+
+def div(a, b):
+    """Quotient of two independent measurements."""
+    return np.array([a[0]/b[0], a[1]/b[0]**2 + a[0]**2*b[1]/b[0]**4])
+
+def ratio(num, den):
+    """
+    prod(num) / prod(den) for independent measurements. Each input must appear
+    only once (no correlations are tracked), so cancel shared factors first.
+    """
+    return div(reduce(mul, num), reduce(mul, den))
+
+def fmt(a):
+    """Formats a measurement as 'value ± error'."""
+    return f"{a[0]:.4g} ± {np.sqrt(a[1]):.2g}"
+
+def get_measurement(d):
+    """Parses a dict with 'value' and 'error' keys into a measurement."""
+    return U(float(d['value']), float(d['error']))
 
 def get_sigma_unc(val1, val2, rounded=1):
     """Calculates the compatibility (in sigmas) between two values."""
-    diff = abs(val1.n - val2.n)
-    unc = np.sqrt(val1.s**2 + val2.s**2)
+    diff = abs(val1[0] - val2[0])
+    unc = np.sqrt(val1[1] + val2[1])
     return round(diff / unc, rounded)
 
 def main():
@@ -35,7 +58,7 @@ def main():
 
     # 2. Parse PDG Constants (Standard Model Baselines)
     try:
-        pdg_vals = dotdict({k: get_ufloat(v) for k, v in cfg['pdg'].items()})
+        pdg_vals = dotdict({k: get_measurement(v) for k, v in cfg['pdg'].items()})
     except KeyError:
         print("Error: 'pdg' section missing from configuration file.")
         sys.exit(1)
@@ -46,9 +69,9 @@ def main():
             ch: dotdict({
                 # FIX: Force str(year) here to handle YAML integer parsing
                 str(year): dotdict({
-                    'lumi': get_ufloat(cfg['channels'][ch][year]['lumi']),
-                    'yields': dotdict({k: get_ufloat(v) for k, v in cfg['channels'][ch][year].get('yields', {}).items()}),
-                    'effs': dotdict({k: get_ufloat(v) for k, v in cfg['channels'][ch][year].get('effs', {}).items()}),
+                    'lumi': get_measurement(cfg['channels'][ch][year]['lumi']),
+                    'yields': dotdict({k: get_measurement(v) for k, v in cfg['channels'][ch][year].get('yields', {}).items()}),
+                    'effs': dotdict({k: get_measurement(v) for k, v in cfg['channels'][ch][year].get('effs', {}).items()}),
                 }) for year in cfg['channels'][ch]
             }) for ch in cfg['channels']
         })
@@ -66,40 +89,43 @@ def main():
 
     # R(K) J/psi (2022)
     # Ratio of (Yield/Lumi)_mu / (Yield/Lumi)_e * (Eff_e / Eff_mu)
-    _rk_jpsi_2022 = (
-        (mu22.yields.n_jpsi / mu22.lumi) / (ee22.yields.n_jpsi / ee22.lumi) *
-        (ee22.effs.eff_jpsi / mu22.effs.eff_jpsi)
+    _rk_jpsi_2022 = ratio(
+        [mu22.yields.n_jpsi, ee22.lumi, ee22.effs.eff_jpsi],
+        [mu22.lumi, ee22.yields.n_jpsi, mu22.effs.eff_jpsi]
     )
 
     # R(K) Psi(2S) (2022)
-    _rk_psi2s_2022 = (
-        (mu22.yields.n_psi2s / mu22.lumi) / (ee22.yields.n_psi2s / ee22.lumi) *
-        (ee22.effs.eff_psi2s / mu22.effs.eff_psi2s)
+    _rk_psi2s_2022 = ratio(
+        [mu22.yields.n_psi2s, ee22.lumi, ee22.effs.eff_psi2s],
+        [mu22.lumi, ee22.yields.n_psi2s, mu22.effs.eff_psi2s]
     )
 
     # Double Ratio 2022: R(K) Psi(2S) / R(K) J/psi
     # This cancels out luminosity and many systematic uncertainties
-    _rk_psi2s_jpsi_2022 = _rk_psi2s_2022 / _rk_jpsi_2022
+    # (written out with the lumis already cancelled, since inputs are treated as independent)
+    _rk_psi2s_jpsi_2022 = ratio(
+        [mu22.yields.n_psi2s, ee22.yields.n_jpsi, ee22.effs.eff_psi2s, mu22.effs.eff_jpsi],
+        [mu22.yields.n_jpsi, ee22.yields.n_psi2s, ee22.effs.eff_jpsi, mu22.effs.eff_psi2s]
+    )
 
     # Mixed Era Checks (2018 Muons vs 2022 Electrons)
     # Useful for stability checks if 2022 muon data is suspect
-    _rk_jpsi_2018 = (
-        (mu18.yields.n_jpsi / mu18.lumi) / (ee22.yields.n_jpsi / ee22.lumi) *
-        (ee22.effs.eff_jpsi / mu18.effs.eff_jpsi)
+    _rk_jpsi_2018 = ratio(
+        [mu18.yields.n_jpsi, ee22.lumi, ee22.effs.eff_jpsi],
+        [mu18.lumi, ee22.yields.n_jpsi, mu18.effs.eff_jpsi]
     )
-    _rk_psi2s_2018 = (
-        (mu18.yields.n_psi2s / mu18.lumi) / (ee22.yields.n_psi2s / ee22.lumi) *
-        (ee22.effs.eff_psi2s / mu18.effs.eff_psi2s)
+    _rk_psi2s_jpsi_2018 = ratio(
+        [mu18.yields.n_psi2s, ee22.yields.n_jpsi, ee22.effs.eff_psi2s, mu18.effs.eff_jpsi],
+        [mu18.yields.n_jpsi, ee22.yields.n_psi2s, ee22.effs.eff_jpsi, mu18.effs.eff_psi2s]
     )
-    _rk_psi2s_jpsi_2018 = _rk_psi2s_2018 / _rk_jpsi_2018
 
     # Branching Fraction Ratios (Data vs PDG)
-    _ratio_psi2s_jpsi_mu_2022 = (mu22.yields.n_psi2s / mu22.yields.n_jpsi) * (mu22.effs.eff_jpsi / mu22.effs.eff_psi2s)
-    _ratio_psi2s_jpsi_el_2022 = (ee22.yields.n_psi2s / ee22.yields.n_jpsi) * (ee22.effs.eff_jpsi / ee22.effs.eff_psi2s)
+    _ratio_psi2s_jpsi_mu_2022 = ratio([mu22.yields.n_psi2s, mu22.effs.eff_jpsi], [mu22.yields.n_jpsi, mu22.effs.eff_psi2s])
+    _ratio_psi2s_jpsi_el_2022 = ratio([ee22.yields.n_psi2s, ee22.effs.eff_jpsi], [ee22.yields.n_jpsi, ee22.effs.eff_psi2s])
     
     # PDG Expectations
-    _pdg_ratio_mu = (pdg_vals.br_b_to_psi2sk * pdg_vals.br_psi2s_to_mumu) / (pdg_vals.br_b_to_jpsik * pdg_vals.br_jpsi_to_mumu)
-    _pdg_ratio_ee = (pdg_vals.br_b_to_psi2sk * pdg_vals.br_psi2s_to_ee)   / (pdg_vals.br_b_to_jpsik * pdg_vals.br_jpsi_to_ee)
+    _pdg_ratio_mu = ratio([pdg_vals.br_b_to_psi2sk, pdg_vals.br_psi2s_to_mumu], [pdg_vals.br_b_to_jpsik, pdg_vals.br_jpsi_to_mumu])
+    _pdg_ratio_ee = ratio([pdg_vals.br_b_to_psi2sk, pdg_vals.br_psi2s_to_ee],   [pdg_vals.br_b_to_jpsik, pdg_vals.br_jpsi_to_ee])
 
     # --- Output ---
     # Width configurations
@@ -118,17 +144,17 @@ def main():
     print(f"{'='*80}")
     
     print('\n--- 2022 Era (Muon + Electron) ---')
-    print(f"{l_rk_jpsi:<{L_WIDTH}} : {str(_rk_jpsi_2022):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(ufloat(1,0), _rk_jpsi_2022)}σ)")
-    print(f"{l_rk_psi2s:<{L_WIDTH}} : {str(_rk_psi2s_2022):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(ufloat(1,0), _rk_psi2s_2022)}σ)")
-    print(f"{l_double:<{L_WIDTH}} : {str(_rk_psi2s_jpsi_2022):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(ufloat(1,0), _rk_psi2s_jpsi_2022)}σ)")
+    print(f"{l_rk_jpsi:<{L_WIDTH}} : {fmt(_rk_jpsi_2022):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(U(1,0), _rk_jpsi_2022)}σ)")
+    print(f"{l_rk_psi2s:<{L_WIDTH}} : {fmt(_rk_psi2s_2022):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(U(1,0), _rk_psi2s_2022)}σ)")
+    print(f"{l_double:<{L_WIDTH}} : {fmt(_rk_psi2s_jpsi_2022):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(U(1,0), _rk_psi2s_jpsi_2022)}σ)")
 
     print('\n--- Mixed Era (2018 Muon + 2022 Electron) ---')
-    print(f"{l_rk_jpsi:<{L_WIDTH}} : {str(_rk_jpsi_2018):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(ufloat(1,0), _rk_jpsi_2018)}σ)")
-    print(f"{l_double:<{L_WIDTH}} : {str(_rk_psi2s_jpsi_2018):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(ufloat(1,0), _rk_psi2s_jpsi_2018)}σ)")
+    print(f"{l_rk_jpsi:<{L_WIDTH}} : {fmt(_rk_jpsi_2018):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(U(1,0), _rk_jpsi_2018)}σ)")
+    print(f"{l_double:<{L_WIDTH}} : {fmt(_rk_psi2s_jpsi_2018):<{V_WIDTH}} (Pull from 1.0: {get_sigma_unc(U(1,0), _rk_psi2s_jpsi_2018)}σ)")
 
     print('\n--- Internal Ratios (\u03C8(2S) / J/\u03C8) ---')
-    print(f"{l_mu_ratio:<{L_WIDTH}} : {str(_ratio_psi2s_jpsi_mu_2022):<{V_WIDTH}} (PDG: {str(_pdg_ratio_mu)}, Pull: {get_sigma_unc(_pdg_ratio_mu, _ratio_psi2s_jpsi_mu_2022)}σ)")
-    print(f"{l_el_ratio:<{L_WIDTH}} : {str(_ratio_psi2s_jpsi_el_2022):<{V_WIDTH}} (PDG: {str(_pdg_ratio_ee)}, Pull: {get_sigma_unc(_pdg_ratio_ee, _ratio_psi2s_jpsi_el_2022)}σ)")
+    print(f"{l_mu_ratio:<{L_WIDTH}} : {fmt(_ratio_psi2s_jpsi_mu_2022):<{V_WIDTH}} (PDG: {fmt(_pdg_ratio_mu)}, Pull: {get_sigma_unc(_pdg_ratio_mu, _ratio_psi2s_jpsi_mu_2022)}σ)")
+    print(f"{l_el_ratio:<{L_WIDTH}} : {fmt(_ratio_psi2s_jpsi_el_2022):<{V_WIDTH}} (PDG: {fmt(_pdg_ratio_ee)}, Pull: {get_sigma_unc(_pdg_ratio_ee, _ratio_psi2s_jpsi_el_2022)}σ)")
     print(f"{'='*80}")
 
 if __name__ == "__main__":